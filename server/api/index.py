@@ -11,8 +11,8 @@ server_dir = os.path.dirname(current_dir)  # server/
 if server_dir not in sys.path:
     sys.path.insert(0, server_dir)
 
-# Change directory to server so relative paths (templates/static) work
-os.chdir(server_dir)
+# No os.chdir needed: Flask resolves templates/static from app.py's own directory,
+# and everything else (storage, blob client, scheduler) is set up on first use.
 
 # Import the Flask app
 from app import app
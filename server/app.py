@@ -1,26 +1,24 @@
 import os
 import json
-import shutil
-from flask import Flask, request, jsonify, send_from_directory, render_template, Response
+import mimetypes
+import importlib.util
+import threading
+from flask import Flask, request, jsonify, send_file, render_template, Response
 from flask_cors import CORS
 from datetime import datetime, timedelta
-from apscheduler.schedulers.background import BackgroundScheduler
+import math
 import logging
-
-# Try to import blob storage (optional)
-try:
-    # In Vercel, we're in server/ directory, so direct import should work
-    from blob_storage import put_blob, get_blob, delete_blob, list_blobs
-    BLOB_STORAGE_AVAILABLE = True
-    logging.info("Blob storage module loaded successfully")
-except ImportError as e:
-    BLOB_STORAGE_AVAILABLE = False
-    logging.warning(f"Blob storage module not available: {e}. Using local storage only.")
-    logging.warning(f"Import error details: {type(e).__name__}: {str(e)}")
-except Exception as e:
-    BLOB_STORAGE_AVAILABLE = False
-    logging.error(f"Unexpected error loading blob storage: {e}")
-    logging.error(f"Error type: {type(e).__name__}")
+from integrity import Scrubber, VerificationFailed, digest_header
+from rate_limit import ClientRateLimiter, Throttled
+from storage import LocalStorage, BlobStorage, TieredStorage, normalize_key
+
+# Blob storage is optional. Only check that it can be imported here; the module
+# (and requests) are loaded on first use to keep serverless cold starts fast.
+# In Vercel, we're in server/ directory, so direct import should work
+BLOB_STORAGE_AVAILABLE = (importlib.util.find_spec('blob_storage') is not None
+                          and importlib.util.find_spec('requests') is not None)
+if not BLOB_STORAGE_AVAILABLE:
+    logging.warning("Blob storage module not available. Using local storage only.")
 
 app = Flask(__name__)
 
@@ -35,8 +33,26 @@ DATA_DIR = os.environ.get('DATA_DIR', '/tmp')
 UPLOAD_FOLDER = os.path.join(DATA_DIR, 'uploads')
 CLIENT_DATA_FILE = os.path.join(DATA_DIR, 'clients.json')
 SETTINGS_FILE = os.path.join(DATA_DIR, 'settings.json')
+INTEGRITY_STATE_FILE = os.path.join(DATA_DIR, 'integrity.json')
+# 'local', 'blob' or 'tiered' (local write-back cache in front of blob storage)
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'blob' if USE_BLOB_STORAGE else 'local')
 MAX_STORAGE_BYTES = 5 * 1024 * 1024 * 1024  # 5GB total storage limit
 
+# Admission control (0 = unlimited). Defaults can be overridden per client
+# through /admin/clients/<client_id>/settings.
+DEFAULT_RATE_LIMIT_PER_MINUTE = int(os.environ.get('RATE_LIMIT_PER_MINUTE', 120))
+DEFAULT_BANDWIDTH_LIMIT_KBPS = int(os.environ.get('BANDWIDTH_LIMIT_KBPS', 0))
+UPLOAD_SLOTS = int(os.environ.get('UPLOAD_SLOTS', 4))  # Concurrent uploads, shared fairly between clients
+MAX_ACTIVE_UPLOADS_PER_CLIENT = max(1, UPLOAD_SLOTS // 2)  # So slow (paced) uploads can't hold every slot
+MAX_QUEUED_UPLOADS_PER_CLIENT = 8
+UPLOAD_QUEUE_TIMEOUT = 30  # Seconds an upload may wait for a slot
+
+# Integrity scrubbing: files re-verified per run, hashing threads, and read rate limit
+SCRUB_BATCH_SIZE = int(os.environ.get('SCRUB_BATCH_SIZE', 100))
+SCRUB_WORKERS = int(os.environ.get('SCRUB_WORKERS', 4))
+SCRUB_BYTES_PER_SECOND = int(os.environ.get('SCRUB_BYTES_PER_SECOND', 10 * 1024 * 1024))
+SCRUB_INTERVAL_MINUTES = 10
+
 # Set upload limit to 5GB
 app.config['MAX_CONTENT_LENGTH'] = 5 * 1024 * 1024 * 1024  # 5GB max file size
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
@@ -53,18 +69,66 @@ def save_json(filename, data):
     with open(filename, 'w') as f:
         json.dump(data, f, indent=4)
 
+# Set if blob_storage could not be imported when the storage was created
+BLOB_IMPORT_ERROR = None
+
+def create_storage():
+    """Builds the configured storage backend (plus the local one used as fallback)."""
+    global BLOB_IMPORT_ERROR
+    local = LocalStorage(UPLOAD_FOLDER)
+    if STORAGE_BACKEND in ('blob', 'tiered') and not USE_BLOB_STORAGE:
+        logging.warning(f"STORAGE_BACKEND={STORAGE_BACKEND} needs blob storage, using local storage")
+        return local, local
+    if STORAGE_BACKEND in ('blob', 'tiered'):
+        # The module is only imported here, so a broken install surfaces now rather than at startup
+        try:
+            blob = BlobStorage()
+        except Exception as e:
+            BLOB_IMPORT_ERROR = f"{type(e).__name__}: {e}"
+            logging.error(f"Could not load blob storage ({BLOB_IMPORT_ERROR}), using local storage")
+            return local, local
+        if STORAGE_BACKEND == 'tiered':
+            return TieredStorage(LocalStorage(os.path.join(DATA_DIR, 'blob-cache')), blob), local
+        return blob, local
+    return local, local
+
+def get_client_limits(client_data):
+    """Returns (requests per minute, bandwidth in KB/s) for a client, falling back to the defaults."""
+    rate_limit = client_data.get('rate_limit_per_minute')
+    bandwidth_limit = client_data.get('bandwidth_limit_kbps')
+    return (
+        DEFAULT_RATE_LIMIT_PER_MINUTE if rate_limit is None else rate_limit,
+        DEFAULT_BANDWIDTH_LIMIT_KBPS if bandwidth_limit is None else bandwidth_limit
+    )
+
+_storage_backends = None
+_storage_lock = threading.Lock()
+
+def get_storage_backends():
+    """Returns (storage, local_storage), creating them on first use rather than at import."""
+    global _storage_backends
+    if _storage_backends is None:
+        with _storage_lock:
+            if _storage_backends is None:
+                _storage_backends = create_storage()
+    return _storage_backends
+
+def get_storage():
+    """The configured storage backend."""
+    return get_storage_backends()[0]
+
+def get_lookup_backends():
+    """Backends to search for an existing file (the configured one, then the local fallback)."""
+    storage, local_storage = get_storage_backends()
+    return [storage] if storage is local_storage else [storage, local_storage]
+
 def get_storage_usage():
     """Calculate total storage usage in bytes."""
-    total_size = 0
     try:
-        for root, dirs, files in os.walk(UPLOAD_FOLDER):
-            for file in files:
-                file_path = os.path.join(root, file)
-                if os.path.exists(file_path):
-                    total_size += os.path.getsize(file_path)
+        return get_storage().usage()
     except OSError as e:
         logging.error(f"Error calculating storage usage: {e}")
-    return total_size
+        return 0
 
 def format_bytes(bytes_value):
     """Convert bytes to human readable format."""
@@ -74,8 +138,18 @@ def format_bytes(bytes_value):
         bytes_value /= 1024.0
     return f"{bytes_value:.1f} TB"
 
-# Ensure the upload folder exists
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+rate_limiter = ClientRateLimiter(UPLOAD_SLOTS, MAX_ACTIVE_UPLOADS_PER_CLIENT, MAX_QUEUED_UPLOADS_PER_CLIENT,
+                                 UPLOAD_QUEUE_TIMEOUT)
+
+def get_storage_copies():
+    """Every (label, backend) that may hold a copy of a file."""
+    copies = []
+    for backend in get_lookup_backends():
+        copies.extend(backend.copies())
+    return copies
+
+scrubber = Scrubber(get_lookup_backends, get_storage_copies, INTEGRITY_STATE_FILE,
+                    SCRUB_BATCH_SIZE, SCRUB_WORKERS, SCRUB_BYTES_PER_SECOND)
 
 logging.basicConfig(level=logging.INFO)
 
@@ -92,6 +166,7 @@ def ping():
 
     client_id = data['client_id']
     client_type = data.get('type', 'unknown')
+    rate_limiter.check_request(client_id, get_client_limits(clients.get(client_id, {}))[0])
     
     # If client is new, initialize with default settings
     if client_id not in clients:
@@ -112,7 +187,7 @@ def cleanup_old_files():
     """Remove files older than each client's configured retention period."""
     logging.info(f"Running granular cleanup task...")
     now = datetime.now()
-    upload_folder = app.config['UPLOAD_FOLDER']
+    storage = get_storage()
     current_storage = get_storage_usage()
     storage_percent = (current_storage / MAX_STORAGE_BYTES) * 100
     
@@ -130,24 +205,28 @@ def cleanup_old_files():
             retention_days = min(retention_days, 7)  # Max 7 days when storage is critical
             logging.info(f"Storage critical ({storage_percent:.1f}%), reducing retention to {retention_days} days for client {client_id}")
         
-        client_dir = os.path.join(upload_folder, client_id)
-        
-        if not os.path.isdir(client_dir):
-            continue
-
         logging.info(f"Checking client '{client_id}' with retention of {retention_days} days.")
         
-        for date_folder in os.listdir(client_dir):
-            folder_path = os.path.join(client_dir, date_folder)
-            if os.path.isdir(folder_path):
-                try:
-                    folder_date = datetime.strptime(date_folder, '%Y-%m-%d')
-                    if now - folder_date > timedelta(days=retention_days):
-                        logging.info(f"Deleting old folder: {folder_path}")
-                        shutil.rmtree(folder_path)
-                except ValueError:
-                    # Not a date-formatted folder, ignore.
-                    pass
+        expired_keys = []
+        expired_folders = set()
+        for entry in storage.iter_entries(f"{client_id}/"):
+            # Keys look like client_id/YYYY-MM-DD/...
+            parts = entry['pathname'].split('/')
+            if len(parts) < 3:
+                continue
+            try:
+                folder_date = datetime.strptime(parts[1], '%Y-%m-%d')
+            except ValueError:
+                # Not a date-formatted folder, ignore.
+                continue
+            if now - folder_date > timedelta(days=retention_days):
+                expired_keys.append(entry['pathname'])
+                expired_folders.add(f"{client_id}/{parts[1]}")
+        
+        for folder in sorted(expired_folders):
+            logging.info(f"Deleting old folder: {folder}")
+        if expired_keys:
+            storage.delete_batch(expired_keys)
     
     # Log final storage usage
     final_storage = get_storage_usage()
@@ -155,8 +234,62 @@ def cleanup_old_files():
     logging.info(f"Cleanup completed. Final storage usage: {format_bytes(final_storage)} ({final_percent:.1f}%)")
 
 
+def get_stream_size(stream):
+    """Returns the size of a seekable stream without consuming it."""
+    position = stream.tell()
+    stream.seek(0, os.SEEK_END)
+    size = stream.tell()
+    stream.seek(position)
+    return size
+
+
+def check_storage_quota(storage, size):
+    """Returns a 507 response if storing `size` more bytes would exceed the limit (local storage only)."""
+    if not storage.quota_enforced:
+        return None
+    current_storage = get_storage_usage()
+    if current_storage + size > MAX_STORAGE_BYTES:
+        return jsonify({
+            "error": "Storage limit exceeded",
+            "message": f"Upload would exceed 5GB storage limit. Current usage: {format_bytes(current_storage)}"
+        }), 507  # 507 Insufficient Storage
+    return None
+
+
+def find_client_by_ip(clients, ip_address):
+    """Returns the only client whose last /ping came from ip_address, or None."""
+    matches = [client_id for client_id, client_data in clients.items()
+               if client_data.get('ip_address') == ip_address]
+    return matches[0] if len(matches) == 1 else None
+
 @app.route('/upload', methods=['POST'])
 def upload_file():
+    # Admission control runs before the request body is read. Clients can identify
+    # themselves with an X-Client-ID header or client_id query argument; otherwise
+    # they are matched by the IP address their /ping came from, and failing that
+    # limited by IP address with the defaults.
+    clients = load_json(CLIENT_DATA_FILE, {})
+    claimed_id = request.headers.get('X-Client-ID') or request.args.get('client_id')
+    admission_id = (claimed_id or find_client_by_ip(clients, request.remote_addr)
+                    or f"ip:{request.remote_addr}")
+    rate_limit, bandwidth_limit = get_client_limits(clients.get(admission_id, {}))
+    rate_limiter.check_request(admission_id, rate_limit)
+    
+    storage, local_storage = get_storage_backends()
+    if request.content_length is not None:
+        quota_error = check_storage_quota(storage, request.content_length)
+        if quota_error:
+            return quota_error
+    
+    # Wait for an upload slot; slots are handed out round-robin across clients
+    with rate_limiter.upload_slot(admission_id):
+        # Read the body no faster than the client's bandwidth limit
+        request.environ['wsgi.input'] = rate_limiter.pace_stream(
+            admission_id, request.environ['wsgi.input'], bandwidth_limit)
+        return receive_upload(storage, local_storage, claimed_id)
+
+def receive_upload(storage, local_storage, claimed_id):
+    """Parses the upload form and stores the file."""
     if 'file' not in request.files:
         return jsonify({"error": "No file part"}), 400
     if 'client_id' not in request.form or 'relative_path' not in request.form:
@@ -168,50 +301,49 @@ def upload_file():
 
     if file.filename == '':
         return jsonify({"error": "No selected file"}), 400
+    if claimed_id and claimed_id != client_id:
+        return jsonify({"error": "client_id does not match X-Client-ID"}), 400
 
     if file:
-        # Read file data
-        file_data = file.read()
-        file_size = len(file_data)
-        
-        # Check storage limit before upload (only for local storage)
-        if not USE_BLOB_STORAGE:
-            current_storage = get_storage_usage()
-            if current_storage + file_size > MAX_STORAGE_BYTES:
-                return jsonify({
-                    "error": "Storage limit exceeded",
-                    "message": f"Upload would exceed 5GB storage limit. Current usage: {format_bytes(current_storage)}"
-                }), 507  # 507 Insufficient Storage
+        file_size = get_stream_size(file.stream)
         
-        # Construct blob path: uploads/client_id/relative_path
-        blob_path = f"uploads/{client_id}/{relative_path}".replace("\\", "/")
+        # Without a Content-Length the storage limit can only be checked now
+        if request.content_length is None:
+            quota_error = check_storage_quota(storage, file_size)
+            if quota_error:
+                return quota_error
         
-        if USE_BLOB_STORAGE:
-            # Upload to Vercel Blob Storage
-            result = put_blob(blob_path, file_data, access='public')
-            if result:
-                logging.info(f"File {relative_path} uploaded to Vercel Blob successfully")
-                return jsonify({
-                    "message": f"File {relative_path} uploaded successfully",
-                    "url": result.get('url')
-                }), 201
-            else:
-                # Fallback to local storage if blob upload fails
-                logging.warning("Blob upload failed, falling back to local storage")
+        # Storage key: client_id/relative_path
+        key = normalize_key(f"{client_id}/{relative_path}")
         
-        # Local storage fallback
-        upload_path = os.path.join(app.config['UPLOAD_FOLDER'], client_id, relative_path)
-        os.makedirs(os.path.dirname(upload_path), exist_ok=True)
+        # The backend computes and stores the checksum while the upload streams in.
+        # Truncated uploads and, if the client sent one, a mismatched checksum are
+        # rejected before they replace any existing copy of the file.
+        expected_sha256 = request.form.get('sha256')
+        try:
+            result = storage.put_stream(key, file.stream, file_size, expected_sha256)
+            
+            if result is None and storage is not local_storage:
+                # Fallback to local storage if the backend upload fails
+                logging.warning(f"Upload to {storage.name} storage failed, falling back to local storage")
+                file.stream.seek(0)
+                result = local_storage.put_stream(key, file.stream, file_size, expected_sha256)
+        except VerificationFailed as e:
+            if e.field == 'size':
+                logging.error(f"Upload of {relative_path} is incomplete: read {e.actual} of {e.expected} bytes")
+                return jsonify({"error": "Upload verification failed", "message": "The file was not stored completely"}), 500
+            return jsonify({"error": "Checksum mismatch", "message": str(e)}), 400
         
-        with open(upload_path, 'wb') as f:
-            f.write(file_data)
+        if result is None:
+            return jsonify({"error": "Internal server error"}), 500
         
-        # Log storage usage after upload
-        if not USE_BLOB_STORAGE:
-            new_storage = get_storage_usage()
-            logging.info(f"Storage usage: {format_bytes(new_storage)} / {format_bytes(MAX_STORAGE_BYTES)}")
+        sha256 = result['sha256']
+        logging.info(f"File {relative_path} uploaded to {storage.name} storage successfully")
         
-        return jsonify({"message": f"File {relative_path} uploaded successfully"}), 201
+        response = {"message": f"File {relative_path} uploaded successfully", "sha256": sha256}
+        if result.get('url'):
+            response['url'] = result['url']
+        return jsonify(response), 201
 
 @app.route('/create-dir', methods=['POST'])
 def create_dir():
@@ -222,10 +354,10 @@ def create_dir():
     
     client_id = data['client_id']
     relative_path = data['relative_path']
+    rate_limiter.check_request(client_id, get_client_limits(load_json(CLIENT_DATA_FILE, {}).get(client_id, {}))[0])
     
     try:
-        dir_path = os.path.join(app.config['UPLOAD_FOLDER'], client_id, relative_path)
-        os.makedirs(dir_path, exist_ok=True)
+        get_storage().make_dir(f"{client_id}/{relative_path}")
         return jsonify({"message": f"Directory {relative_path} created successfully"}), 201
     except Exception as e:
         logging.error(f"Error creating directory {relative_path}: {e}")
@@ -248,51 +380,32 @@ def list_files():
                 "files": []
             }
 
-    if USE_BLOB_STORAGE:
-        # List files from blob storage
-        blobs = list_blobs('uploads/')
-        if blobs:
-            # Build tree from blob paths
-            for blob in blobs:
-                path = blob.get('pathname', '')
-                # Path format: uploads/client_id/relative_path
-                if path.startswith('uploads/'):
-                    parts = path[len('uploads/'):].split('/')
-                    if len(parts) >= 2:
-                        client_id = parts[0]
-                        relative_path = '/'.join(parts[1:])
-                        
-                        if client_id not in client_files:
-                            client_files[client_id] = {
-                                "label": clients.get(client_id, {}).get('label', client_id),
-                                "files": []
-                            }
-                        
-                        if 'tree' not in client_files[client_id]:
-                            client_files[client_id]['tree'] = {}
-                        
-                        # Build tree structure
-                        build_tree_from_path(client_files[client_id]['tree'], relative_path.split('/'), path)
-    else:
-        # Use local file system
-        upload_folder = app.config['UPLOAD_FOLDER']
-        if os.path.isdir(upload_folder):
-            for client_id in os.listdir(upload_folder):
-                client_dir = os.path.join(upload_folder, client_id)
-                if os.path.isdir(client_dir):
-                    if client_id not in client_files:
-                         client_files[client_id] = {
-                            "label": clients.get(client_id, {}).get('label', client_id),
-                            "files": [] # Kept for backward compatibility if needed, but tree is primary
-                        }
-                    
-                    client_files[client_id]['tree'] = build_file_tree(client_dir, upload_folder)
+    for entry in get_storage().iter_entries():
+        # Key format: client_id/relative_path (folders end with '/')
+        key = entry['pathname']
+        parts = key.split('/')
+        if len(parts) < 2:
+            continue
+        client_id = parts[0]
+        
+        if client_id not in client_files:
+            client_files[client_id] = {
+                "label": clients.get(client_id, {}).get('label', client_id),
+                "files": [] # Kept for backward compatibility if needed, but tree is primary
+            }
+        
+        if 'tree' not in client_files[client_id]:
+            client_files[client_id]['tree'] = {}
+        
+        # Build tree structure
+        build_tree_from_path(client_files[client_id]['tree'], parts[1:], key)
 
     return jsonify(client_files)
 
-def build_tree_from_path(tree, path_parts, full_path):
+def build_tree_from_path(tree, path_parts, key):
     """Builds a tree structure from a path list."""
-    if not path_parts:
+    # An empty last part comes from a folder key ending in '/'
+    if not path_parts or not path_parts[0]:
         return
     
     part = path_parts[0]
@@ -300,7 +413,7 @@ def build_tree_from_path(tree, path_parts, full_path):
         # This is a file
         tree[part] = {
             "type": "file",
-            "path": full_path.replace("uploads/", "")
+            "path": key
         }
     else:
         # This is a folder
@@ -309,80 +422,79 @@ def build_tree_from_path(tree, path_parts, full_path):
                 "type": "folder",
                 "children": {}
             }
-        build_tree_from_path(tree[part]["children"], path_parts[1:], full_path)
+        build_tree_from_path(tree[part]["children"], path_parts[1:], key)
 
-def build_file_tree(dir_path, base_path):
-    """Recursively builds a file and folder tree."""
-    tree = {}
-    try:
-        for entry in os.listdir(dir_path):
-            full_path = os.path.join(dir_path, entry)
-            if os.path.isdir(full_path):
-                tree[entry] = {
-                    "type": "folder",
-                    "children": build_file_tree(full_path, base_path)
-                }
-            else:
-                tree[entry] = {
-                    "type": "file",
-                    "path": os.path.relpath(full_path, base_path).replace("\\", "/")
-                }
-    except OSError as e:
-        logging.error(f"Error building file tree for {dir_path}: {e}")
-    return tree
+
+def send_stored_file(backend, filepath, as_attachment):
+    """Sends a file from a backend, honouring Range requests. Returns None if missing."""
+    # Files on local disk are sent directly (with conditional and range support)
+    local_path = backend.local_path(filepath)
+    if local_path:
+        return send_file(local_path, as_attachment=as_attachment,
+                         download_name=os.path.basename(filepath), conditional=True)
+    
+    status = 200
+    headers = {}
+    if request.range and request.range.units == 'bytes':
+        entry = backend.stat(filepath)
+        if entry is None:
+            return None
+        byte_range = request.range.range_for_length(entry['size'])
+        if byte_range is None:
+            return Response(status=416, headers={'Content-Range': f"bytes */{entry['size']}"})
+        start, end = byte_range
+        file_data = backend.get_range(filepath, start, end)
+        status = 206
+        headers['Content-Range'] = f"bytes {start}-{end - 1}/{entry['size']}"
+    else:
+        file_data = backend.get_range(filepath)
+    
+    if file_data is None:
+        return None
+    
+    content_disposition = 'attachment' if as_attachment else 'inline'
+    headers['Content-Disposition'] = f'{content_disposition}; filename={os.path.basename(filepath)}'
+    headers['Accept-Ranges'] = 'bytes'
+    return Response(
+        file_data,
+        status=status,
+        mimetype=mimetypes.guess_type(filepath)[0] or 'application/octet-stream',
+        headers=headers
+    )
 
 
 @app.route('/files/<path:filepath>', methods=['GET', 'DELETE'])
 def handle_file(filepath):
     """Downloads or deletes a file."""
-    blob_path = f"uploads/{filepath}".replace("\\", "/")
+    filepath = normalize_key(filepath)
     
     if request.method == 'GET':
-        if USE_BLOB_STORAGE:
-            # Try to get from blob storage first
-            file_data = get_blob(blob_path)
-            if file_data:
-                # Check if it's a PDF and if the request is for viewing
-                is_pdf = filepath.lower().endswith('.pdf')
-                is_view_request = request.args.get('view') == 'true'
-                content_disposition = 'inline' if (is_pdf and is_view_request) else 'attachment'
-                
-                response = Response(
-                    file_data,
-                    mimetype='application/octet-stream',
-                    headers={
-                        'Content-Disposition': f'{content_disposition}; filename={os.path.basename(filepath)}'
-                    }
-                )
-                return response
-        
-        # Fallback to local storage
+        # Check if it's a PDF and if the request is for viewing
         is_pdf = filepath.lower().endswith('.pdf')
         is_view_request = request.args.get('view') == 'true'
         as_attachment = not (is_pdf and is_view_request)
-        return send_from_directory(app.config['UPLOAD_FOLDER'], filepath, as_attachment=as_attachment)
+        
+        for backend in get_lookup_backends():
+            response = send_stored_file(backend, filepath, as_attachment)
+            if response is not None:
+                # Let receivers verify the download against the checksum recorded at upload
+                meta = backend.get_meta(filepath)
+                if meta:
+                    response.headers['Digest'] = digest_header(meta['sha256'])
+                    response.headers['X-Checksum-SHA256'] = meta['sha256']
+                return response
+        return jsonify({"error": "File not found"}), 404
     
     if request.method == 'DELETE':
-        deleted = False
-        if USE_BLOB_STORAGE:
-            deleted = delete_blob(blob_path)
+        # Only single files can be deleted through the API
+        if not filepath or filepath.endswith('/'):
+            return jsonify({"error": "A file path is required"}), 400
         
+        deleted = False
         # Also try local storage (for fallback or hybrid scenarios)
-        try:
-            file_path = os.path.join(app.config['UPLOAD_FOLDER'], filepath.replace('/', os.path.sep))
-            if os.path.exists(file_path):
-                os.remove(file_path)
+        for backend in get_lookup_backends():
+            if backend.delete_batch([filepath]):
                 deleted = True
-                # Check if the containing date directory is empty and remove it.
-                dir_path = os.path.dirname(file_path)
-                if os.path.exists(dir_path) and not os.listdir(dir_path):
-                    os.rmdir(dir_path)
-                    # Also check the parent (client) directory
-                    client_dir = os.path.dirname(dir_path)
-                    if os.path.exists(client_dir) and not os.listdir(client_dir):
-                        os.rmdir(client_dir)
-        except Exception as e:
-            logging.error(f"Error deleting local file {filepath}: {e}")
         
         if deleted:
             return jsonify({"message": f"File {filepath} deleted successfully"}), 200
@@ -423,7 +535,7 @@ def set_client_label(client_id):
 
 @app.route('/admin/clients/<client_id>/settings', methods=['POST'])
 def set_client_settings(client_id):
-    """Sets settings (label, retention) for a client."""
+    """Sets settings (label, retention, rate limits) for a client."""
     # Load fresh data from disk
     clients = load_json(CLIENT_DATA_FILE, {})
     
@@ -436,6 +548,19 @@ def set_client_settings(client_id):
             clients[client_id]['label'] = data['label']
         if 'retention_days' in data:
             clients[client_id]['retention_days'] = int(data['retention_days'])
+        # Rate limits: 0 disables the limit, null/empty reverts to the server default
+        for key in ('rate_limit_per_minute', 'bandwidth_limit_kbps'):
+            if key in data:
+                if data[key] in (None, ''):
+                    clients[client_id].pop(key, None)
+                    continue
+                try:
+                    limit = int(data[key])
+                except (TypeError, ValueError):
+                    return jsonify({"error": f"{key} must be a whole number"}), 400
+                if limit < 0:
+                    return jsonify({"error": f"{key} must not be negative"}), 400
+                clients[client_id][key] = limit
         
         save_json(CLIENT_DATA_FILE, clients)
         return jsonify({"message": "Client settings updated successfully"}), 200
@@ -443,6 +568,17 @@ def set_client_settings(client_id):
         return jsonify({"error": "Client not found"}), 404
 
 
+@app.route('/admin/integrity', methods=['GET'])
+def get_integrity_report():
+    """Reports checksum verification state, including mismatched or missing files."""
+    return jsonify(scrubber.report())
+
+@app.route('/admin/integrity/scrub', methods=['POST'])
+def run_integrity_scrub():
+    """Verifies the next batch of files now (e.g. from a Vercel Cron Job)."""
+    return jsonify(scrubber.run())
+
+
 # --- New API Endpoints ---
 
 @app.route('/api/analytics', methods=['GET'])
@@ -453,35 +589,29 @@ def get_analytics():
     uploads_by_day = {}
     uploads_by_client = {}
     
-    upload_folder = app.config['UPLOAD_FOLDER']
-    
-    for client_id in os.listdir(upload_folder):
-        client_dir = os.path.join(upload_folder, client_id)
-        if os.path.isdir(client_dir):
-            uploads_by_client[client_id] = 0
-            for root, _, files in os.walk(client_dir):
-                for name in files:
-                    full_path = os.path.join(root, name)
-                    try:
-                        file_size = os.path.getsize(full_path)
-                        total_size += file_size
-                        total_files += 1
-                        uploads_by_client[client_id] += 1
-                        
-                        # Get date from folder structure (e.g., .../client_id/YYYY-MM-DD/...)
-                        # This is a bit fragile; assumes a specific structure.
-                        path_parts = full_path.split(os.sep)
-                        for part in path_parts:
-                            try:
-                                date_obj = datetime.strptime(part, '%Y-%m-%d')
-                                day_str = date_obj.strftime('%Y-%m-%d')
-                                uploads_by_day[day_str] = uploads_by_day.get(day_str, 0) + 1
-                                break
-                            except ValueError:
-                                continue
-                                
-                    except OSError:
-                        pass # File might have been deleted
+    for entry in get_storage().iter_entries():
+        parts = entry['pathname'].split('/')
+        if len(parts) < 2:
+            continue
+        client_id = parts[0]
+        uploads_by_client.setdefault(client_id, 0)
+        if entry['pathname'].endswith('/'):
+            continue  # Folder marker, not a file
+        
+        total_size += entry.get('size', 0)
+        total_files += 1
+        uploads_by_client[client_id] += 1
+        
+        # Get date from folder structure (e.g., client_id/YYYY-MM-DD/...)
+        # This is a bit fragile; assumes a specific structure.
+        for part in parts[1:-1]:
+            try:
+                date_obj = datetime.strptime(part, '%Y-%m-%d')
+                day_str = date_obj.strftime('%Y-%m-%d')
+                uploads_by_day[day_str] = uploads_by_day.get(day_str, 0) + 1
+                break
+            except ValueError:
+                continue
 
     # Sort daily uploads for the chart
     sorted_uploads = sorted(uploads_by_day.items())
@@ -519,33 +649,39 @@ def too_large(e):
         "message": "File size exceeds the 5GB limit. Please compress or split the file."
     }), 413
 
+@app.errorhandler(Throttled)
+def throttled(e):
+    """Handle a client exceeding its rate limits (429 Too Many Requests)."""
+    response = jsonify({
+        "error": "Too many requests",
+        "message": str(e)
+    })
+    response.headers['Retry-After'] = str(max(1, math.ceil(e.retry_after)))
+    return response, 429
+
 @app.route('/api/test-blob', methods=['GET'])
 def test_blob():
     """Test endpoint to verify blob storage connection."""
     import traceback
     
+    storage = get_storage()
     blob_status = {
         "blob_storage_available": BLOB_STORAGE_AVAILABLE,
         "blob_token_set": os.environ.get('BLOB_READ_WRITE_TOKEN') is not None,
         "use_blob_storage": USE_BLOB_STORAGE,
-        "storage_type": "Vercel Blob Storage" if USE_BLOB_STORAGE else "Local filesystem (ephemeral)"
+        "storage_backend": storage.name,
+        "storage_type": "Local filesystem (ephemeral)" if storage.name == 'local' else "Vercel Blob Storage"
     }
     
-    # Try to import blob_storage to see the actual error
-    if not BLOB_STORAGE_AVAILABLE:
-        try:
-            import blob_storage
-            blob_status["import_test"] = "Module exists but import failed earlier"
-        except ImportError as e:
-            blob_status["import_error"] = f"{type(e).__name__}: {str(e)}"
-            blob_status["import_traceback"] = traceback.format_exc().split('\n')[-5:]  # Last 5 lines
-        except Exception as e:
-            blob_status["import_error"] = f"{type(e).__name__}: {str(e)}"
+    # Report why blob storage isn't in use if the module failed to load
+    if BLOB_IMPORT_ERROR:
+        blob_status["import_error"] = BLOB_IMPORT_ERROR
     
     # Try a simple blob operation if available
-    if USE_BLOB_STORAGE:
+    if USE_BLOB_STORAGE and not BLOB_IMPORT_ERROR:
         try:
-            test_result = list_blobs('test/')
+            import blob_storage
+            test_result = blob_storage.list_blobs('test/')
             blob_status["test_list_success"] = True
             blob_status["test_blobs_found"] = len(test_result) if test_result else 0
         except Exception as e:
@@ -559,8 +695,11 @@ if __name__ == '__main__':
     # Scheduler for daily cleanup (only in non-serverless environments)
     # For Vercel, use Vercel Cron Jobs instead
     if not os.environ.get('VERCEL'):
+        # Imported here so serverless cold starts don't pay for the scheduler
+        from apscheduler.schedulers.background import BackgroundScheduler
         scheduler = BackgroundScheduler()
         scheduler.add_job(cleanup_old_files, 'interval', days=1)
+        scheduler.add_job(scrubber.run, 'interval', minutes=SCRUB_INTERVAL_MINUTES)
         scheduler.start()
 
     app.run(host='0.0.0.0', port=5000, debug=True)
@@ -0,0 +1,93 @@
+"""
+Measures cold-start cost of the Vercel entry point (api/index.py): the time to
+import it in a fresh interpreter, the time to serve the first request (GET
+/files, which also sets up storage), and an import-time profile
+(python -X importtime) of the slowest modules.
+
+Usage (from server/):
+    python benchmarks/bench_cold_start.py --runs 5 --top 15
+    python benchmarks/bench_cold_start.py --max-import-ms 300   # fail if over budget
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+API_DIR = os.path.join(SERVER_DIR, 'api')
+
+# Runs in the child interpreter; prints import and first-request times in ms.
+CHILD_SCRIPT = """
+import sys, time
+start = time.perf_counter()
+import index
+imported = time.perf_counter()
+# /files is the first route clients hit and the one that creates the storage backend
+response = index.handler.test_client().get('/files')
+assert response.status_code == 200, response.status_code
+served = time.perf_counter()
+print((imported - start) * 1000, (served - imported) * 1000)
+"""
+
+
+def child_env(data_dir):
+    env = dict(os.environ)
+    env['DATA_DIR'] = data_dir
+    env['PYTHONPATH'] = API_DIR
+    # Measure the default (local storage) path without a blob token
+    env.pop('BLOB_READ_WRITE_TOKEN', None)
+    return env
+
+
+def measure_run(data_dir):
+    out = subprocess.run([sys.executable, '-c', CHILD_SCRIPT], cwd=API_DIR, env=child_env(data_dir),
+                         capture_output=True, text=True, check=True)
+    import_ms, first_request_ms = out.stdout.split()[-2:]
+    return float(import_ms), float(first_request_ms)
+
+
+def import_profile(data_dir):
+    """Returns [(cumulative_us, self_us, module)] from python -X importtime."""
+    out = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import index'], cwd=API_DIR,
+                         env=child_env(data_dir), capture_output=True, text=True, check=True)
+    rows = []
+    for line in out.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, module = line[len('import time:'):].split('|')
+        rows.append((int(cumulative_us), int(self_us), module.rstrip()))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=15, help='Slowest modules to list')
+    parser.add_argument('--max-import-ms', type=float, default=None,
+                        help='Exit with an error if the median import time exceeds this')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        runs = [measure_run(data_dir) for _ in range(args.runs)]
+        profile = import_profile(data_dir)
+
+    import_ms = statistics.median(run[0] for run in runs)
+    first_request_ms = statistics.median(run[1] for run in runs)
+    print(f"Cold start over {args.runs} runs (median):")
+    print(f"  import api/index.py  {import_ms:8.1f} ms")
+    print(f"  first request        {first_request_ms:8.1f} ms")
+    print(f"  total                {import_ms + first_request_ms:8.1f} ms\n")
+
+    print(f"Slowest imports (cumulative, from -X importtime):")
+    for cumulative_us, self_us, module in sorted(profile, reverse=True)[:args.top]:
+        print(f"  {cumulative_us / 1000:8.1f} ms  (self {self_us / 1000:6.1f} ms)  {module}")
+
+    if args.max_import_ms is not None and import_ms > args.max_import_ms:
+        print(f"\nImport time {import_ms:.1f} ms exceeds budget of {args.max_import_ms:.1f} ms")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""
+Compares upload/read latency of the storage backends against the local blob
+stand-in, to measure what the tiered write-back mode saves over plain blob mode.
+
+Usage (from server/):
+    python benchmarks/bench_storage.py --files 50 --size-kb 256 --latency-ms 40
+"""
+import argparse
+import io
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if SERVER_DIR not in sys.path:
+    sys.path.insert(0, SERVER_DIR)
+
+from blob_standin import StandinServer
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    fn(*args)
+    return (time.perf_counter() - start) * 1000
+
+
+def summarize(name, samples):
+    samples = sorted(samples)
+    p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+    print(f"  {name:<8} mean {statistics.mean(samples):8.2f} ms   p95 {p95:8.2f} ms")
+
+
+def run_backend(label, backend, payload, files):
+    keys = [f"bench/2025-01-01/file{i}.pdf" for i in range(files)]
+    puts = [timed(backend.put_stream, key, io.BytesIO(payload)) for key in keys]
+    flush_ms = timed(backend.flush) if hasattr(backend, 'flush') else 0.0
+    gets = [timed(backend.get_range, key) for key in keys]
+    print(f"{label}:")
+    summarize('put', puts)
+    summarize('get', gets)
+    if hasattr(backend, 'flush'):
+        print(f"  write-back drained in {flush_ms:.2f} ms")
+    backend.delete_batch(keys)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--files', type=int, default=50)
+    parser.add_argument('--size-kb', type=int, default=256)
+    parser.add_argument('--latency-ms', type=float, default=40)
+    args = parser.parse_args()
+
+    payload = os.urandom(args.size_kb * 1024)
+    token = 'bench-token'
+    with StandinServer(token=token, latency_ms=args.latency_ms) as standin, \
+            tempfile.TemporaryDirectory() as tmp:
+        # blob_storage reads its configuration at import time
+        os.environ['BLOB_API_BASE'] = standin.url
+        os.environ['BLOB_READ_WRITE_TOKEN'] = token
+        from storage import LocalStorage, BlobStorage, TieredStorage
+
+        print(f"{args.files} files x {args.size_kb} KB, stand-in latency {args.latency_ms} ms\n")
+        run_backend('local', LocalStorage(os.path.join(tmp, 'local')), payload, args.files)
+        run_backend('blob', BlobStorage(), payload, args.files)
+        run_backend('tiered', TieredStorage(LocalStorage(os.path.join(tmp, 'cache')), BlobStorage()),
+                    payload, args.files)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+"""
+Local stand-in for the Vercel Blob REST API used by blob_storage.py.
+
+Keeps blobs in memory and serves the same endpoints (/put, /get, /head,
+/delete, /list) so blob and tiered storage modes can be run and benchmarked
+offline. An artificial per-request latency approximates the round trip to
+the real service.
+
+Usage:
+    python blob_standin.py --port 3001 --latency-ms 40
+    BLOB_API_BASE=http://127.0.0.1:3001 BLOB_READ_WRITE_TOKEN=dev STORAGE_BACKEND=tiered python app.py
+"""
+import argparse
+import threading
+import time
+from datetime import datetime, timezone
+
+from flask import Flask, request, jsonify, Response
+from werkzeug.serving import make_server, WSGIRequestHandler
+
+
+def create_standin_app(token=None, latency_ms=0):
+    """Builds the stand-in Flask app. If token is set, requests must carry it."""
+    standin = Flask(__name__)
+    blobs = {}
+    lock = threading.Lock()
+
+    @standin.before_request
+    def simulate_network():
+        if latency_ms:
+            time.sleep(latency_ms / 1000.0)
+        if token and request.headers.get('Authorization') != f'Bearer {token}':
+            return jsonify({"error": "Unauthorized"}), 403
+
+    def blob_info(pathname):
+        blob = blobs[pathname]
+        return {
+            'pathname': pathname,
+            'url': f"{request.host_url}get?pathname={pathname}",
+            'size': len(blob['data']),
+            'uploadedAt': blob['uploadedAt'],
+        }
+
+    @standin.route('/put', methods=['POST'])
+    def put():
+        pathname = request.form.get('pathname')
+        if not pathname or 'file' not in request.files:
+            return jsonify({"error": "pathname and file are required"}), 400
+        with lock:
+            blobs[pathname] = {
+                'data': request.files['file'].read(),
+                'uploadedAt': datetime.now(timezone.utc).isoformat(),
+            }
+            return jsonify(blob_info(pathname))
+
+    @standin.route('/get', methods=['GET'])
+    def get():
+        pathname = request.args.get('pathname', '')
+        with lock:
+            blob = blobs.get(pathname)
+        if blob is None:
+            return jsonify({"error": "Not found"}), 404
+        data = blob['data']
+        if request.range and request.range.units == 'bytes':
+            byte_range = request.range.range_for_length(len(data))
+            if byte_range is None:
+                return Response(status=416)
+            start, end = byte_range
+            return Response(data[start:end], status=206, mimetype='application/octet-stream',
+                            headers={'Content-Range': f'bytes {start}-{end - 1}/{len(data)}'})
+        return Response(data, mimetype='application/octet-stream')
+
+    @standin.route('/head', methods=['GET'])
+    def head():
+        pathname = request.args.get('pathname', '')
+        with lock:
+            if pathname not in blobs:
+                return jsonify({"error": "Not found"}), 404
+            return jsonify(blob_info(pathname))
+
+    @standin.route('/delete', methods=['POST'])
+    def delete():
+        data = request.json or {}
+        pathnames = data.get('pathnames') or [data.get('pathname')]
+        with lock:
+            for pathname in pathnames:
+                blobs.pop(pathname, None)
+        return jsonify({})
+
+    @standin.route('/list', methods=['GET'])
+    def list_():
+        prefix = request.args.get('prefix', '')
+        cursor = request.args.get('cursor')
+        limit = int(request.args.get('limit', 1000))
+        with lock:
+            names = sorted(name for name in blobs
+                           if name.startswith(prefix) and (not cursor or name > cursor))
+            page = [blob_info(name) for name in names[:limit]]
+        has_more = len(names) > limit
+        return jsonify({
+            'blobs': page,
+            'cursor': page[-1]['pathname'] if has_more else None,
+            'hasMore': has_more,
+        })
+
+    return standin
+
+
+class _QuietRequestHandler(WSGIRequestHandler):
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+class StandinServer:
+    """Runs the stand-in in a background thread, e.g. from a benchmark."""
+
+    def __init__(self, host='127.0.0.1', port=0, token=None, latency_ms=0):
+        self._server = make_server(host, port, create_standin_app(token, latency_ms),
+                                   threaded=True, request_handler=_QuietRequestHandler)
+        self.url = f"http://{host}:{self._server.server_port}"
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=3001)
+    parser.add_argument('--token', default=None, help='Require this bearer token')
+    parser.add_argument('--latency-ms', type=float, default=0,
+                        help='Artificial delay added to every request')
+    args = parser.parse_args()
+    create_standin_app(args.token, args.latency_ms).run(host=args.host, port=args.port,
+                                                        threaded=True)
@@ -12,18 +12,19 @@ and call it from Python, or wait for an official Python SDK.
 import os
 import requests
 import logging
-from typing import Optional, BinaryIO
+from typing import Optional, BinaryIO, Union, Iterable, Tuple
 
-BLOB_API_BASE = "https://blob.vercel-storage.com"
+# Overridable so the API can be pointed at a local stand-in (see blob_standin.py)
+BLOB_API_BASE = os.environ.get('BLOB_API_BASE', "https://blob.vercel-storage.com")
 BLOB_READ_WRITE_TOKEN = os.environ.get('BLOB_READ_WRITE_TOKEN')
 
-def put_blob(path: str, data: bytes, access: str = 'public') -> Optional[dict]:
+def put_blob(path: str, data: Union[bytes, BinaryIO], access: str = 'public') -> Optional[dict]:
     """
     Upload a file to Vercel Blob Storage.
     
     Args:
         path: The path/key for the blob (e.g., 'uploads/client_id/file.pdf')
-        data: File data as bytes
+        data: File data as bytes or a readable binary stream
         access: 'public' or 'private'
     
     Returns:
@@ -53,15 +54,16 @@ def put_blob(path: str, data: bytes, access: str = 'public') -> Optional[dict]:
         logging.error(f"Failed to upload to Vercel Blob: {e}")
         return None
 
-def get_blob(path: str) -> Optional[bytes]:
+def get_blob(path: str, byte_range: Optional[Tuple[int, Optional[int]]] = None) -> Optional[bytes]:
     """
     Download a file from Vercel Blob Storage.
     
     Args:
         path: The path/key of the blob
+        byte_range: Optional (start, end) tuple, end exclusive; None reads to the end
     
     Returns:
-        File data as bytes, or None on error
+        File data as bytes, or None if missing or on error
     """
     if not BLOB_READ_WRITE_TOKEN:
         return None
@@ -71,11 +73,16 @@ def get_blob(path: str) -> Optional[bytes]:
         headers = {
             'Authorization': f'Bearer {BLOB_READ_WRITE_TOKEN}',
         }
+        if byte_range:
+            start, end = byte_range
+            headers['Range'] = f"bytes={start}-{end - 1 if end is not None else ''}"
         params = {
             'pathname': path
         }
         
         response = requests.get(url, headers=headers, params=params, timeout=30)
+        if response.status_code == 404:
+            return None
         response.raise_for_status()
         return response.content
     except Exception as e:
@@ -111,15 +118,80 @@ def delete_blob(path: str) -> bool:
         logging.error(f"Failed to delete from Vercel Blob: {e}")
         return False
 
-def list_blobs(prefix: str = '') -> Optional[list]:
+def delete_blobs(paths: Iterable[str]) -> bool:
+    """
+    Delete several files from Vercel Blob Storage in one request.
+    
+    Args:
+        paths: The paths/keys of the blobs
+    
+    Returns:
+        True if successful, False otherwise
+    """
+    paths = list(paths)
+    if not BLOB_READ_WRITE_TOKEN:
+        return False
+    if not paths:
+        return True
+    
+    try:
+        url = f"{BLOB_API_BASE}/delete"
+        headers = {
+            'Authorization': f'Bearer {BLOB_READ_WRITE_TOKEN}',
+        }
+        data = {
+            'pathnames': paths
+        }
+        
+        response = requests.post(url, headers=headers, json=data, timeout=30)
+        response.raise_for_status()
+        return True
+    except Exception as e:
+        logging.error(f"Failed to delete {len(paths)} blobs from Vercel Blob: {e}")
+        return False
+
+def head_blob(path: str) -> Optional[dict]:
     """
-    List blobs with a given prefix.
+    Fetch the metadata of a file in Vercel Blob Storage without its contents.
+    
+    Args:
+        path: The path/key of the blob
+    
+    Returns:
+        Blob info dict (including 'size'), or None if missing or on error
+    """
+    if not BLOB_READ_WRITE_TOKEN:
+        return None
+    
+    try:
+        url = f"{BLOB_API_BASE}/head"
+        headers = {
+            'Authorization': f'Bearer {BLOB_READ_WRITE_TOKEN}',
+        }
+        params = {
+            'pathname': path
+        }
+        
+        response = requests.get(url, headers=headers, params=params, timeout=30)
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        return response.json()
+    except Exception as e:
+        logging.error(f"Failed to stat Vercel Blob: {e}")
+        return None
+
+def list_blobs_page(prefix: str = '', cursor: Optional[str] = None, limit: int = 1000) -> Optional[dict]:
+    """
+    List one page of blobs with a given prefix.
     
     Args:
         prefix: Path prefix to filter blobs (e.g., 'uploads/client_id/')
+        cursor: Cursor returned by the previous page, or None for the first page
+        limit: Maximum number of blobs to return
     
     Returns:
-        List of blob info dicts, or None on error
+        Dict with 'blobs', 'cursor' and 'hasMore', or None on error
     """
     if not BLOB_READ_WRITE_TOKEN:
         return None
@@ -129,14 +201,37 @@ def list_blobs(prefix: str = '') -> Optional[list]:
         headers = {
             'Authorization': f'Bearer {BLOB_READ_WRITE_TOKEN}',
         }
-        params = {
-            'prefix': prefix
-        } if prefix else {}
+        params = {'limit': limit}
+        if prefix:
+            params['prefix'] = prefix
+        if cursor:
+            params['cursor'] = cursor
         
         response = requests.get(url, headers=headers, params=params, timeout=30)
         response.raise_for_status()
-        return response.json().get('blobs', [])
+        return response.json()
     except Exception as e:
         logging.error(f"Failed to list Vercel Blobs: {e}")
         return None
 
+def list_blobs(prefix: str = '') -> Optional[list]:
+    """
+    List all blobs with a given prefix, following pagination.
+    
+    Args:
+        prefix: Path prefix to filter blobs (e.g., 'uploads/client_id/')
+    
+    Returns:
+        List of blob info dicts, or None on error
+    """
+    blobs = []
+    cursor = None
+    while True:
+        page = list_blobs_page(prefix, cursor)
+        if page is None:
+            return None
+        blobs.extend(page.get('blobs', []))
+        cursor = page.get('cursor')
+        if not page.get('hasMore') or not cursor:
+            return blobs
+
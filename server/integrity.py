@@ -0,0 +1,272 @@
+"""
+Integrity checking for stored files.
+
+Uploads are hashed (SHA-256) while they stream into storage, and each
+backend keeps the checksum alongside the stored object (see storage.py). A
+scrubber then walks the storage listing in small, rate-limited batches,
+re-hashes every copy (local, cache and blob) and records mismatches for the
+admin endpoint.
+"""
+import base64
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Optional, List
+
+from rate_limit import TokenBucket
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class HashingReader:
+    """Wraps a binary stream and hashes everything read through it."""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.size = 0
+        self._hash = hashlib.sha256()
+
+    def read(self, size=-1):
+        data = self.stream.read(size)
+        self._hash.update(data)
+        self.size += len(data)
+        return data
+
+    def hexdigest(self) -> str:
+        return self._hash.hexdigest()
+
+    def verify(self, expected_size: Optional[int] = None, expected_sha256: Optional[str] = None):
+        """Raises VerificationFailed if what was read doesn't match the expected size or checksum."""
+        if expected_size is not None and self.size != expected_size:
+            raise VerificationFailed('size', expected_size, self.size)
+        if expected_sha256 and self.hexdigest() != expected_sha256.lower():
+            raise VerificationFailed('SHA-256', expected_sha256, self.hexdigest())
+
+
+class VerificationFailed(Exception):
+    """Raised when an upload doesn't match the size or checksum it should have."""
+
+    def __init__(self, field: str, expected, actual):
+        super().__init__(f"Expected {field} {expected}, received {actual}")
+        self.field = field
+        self.expected = expected
+        self.actual = actual
+
+
+def digest_header(sha256_hex: str) -> str:
+    """Formats a hex SHA-256 as a Digest header value (RFC 3230)."""
+    return 'sha-256=' + base64.b64encode(bytes.fromhex(sha256_hex)).decode('ascii')
+
+
+class Scrubber:
+    """
+    Re-verifies stored copies against the checksums recorded with them.
+
+    Each run checks the next `batch_size` files of the storage listing,
+    picking up where the previous run stopped and starting over after the
+    last file, and hashes them on a thread pool. Reads across all workers
+    are limited to `bytes_per_second`. Only the listing position, the files
+    with problems and the last run summary are kept in `state_file`.
+    """
+
+    def __init__(self, get_sources, get_copies, state_file: str, batch_size: int,
+                 workers: int, bytes_per_second: int):
+        # Callable returning the backends whose files are checked, in order
+        self.get_sources = get_sources
+        # Callable returning [(label, backend)] for every place a copy may live
+        self.get_copies = get_copies
+        self.state_file = state_file
+        self.batch_size = batch_size
+        self.workers = workers
+        self.bucket = TokenBucket(bytes_per_second, CHUNK_SIZE) if bytes_per_second else None
+        self._run_lock = threading.Lock()
+
+    def _load_state(self) -> dict:
+        state = {'source': 0, 'cursor': None, 'problems': {}, 'last_run': None,
+                 'last_full_pass': None}
+        try:
+            with open(self.state_file, 'r') as f:
+                state.update(json.load(f))
+        except (OSError, ValueError):
+            pass
+        return state
+
+    def _save_state(self, state: dict):
+        # Write atomically so a concurrent report never sees a half-written file
+        directory = os.path.dirname(self.state_file) or '.'
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.integrity-')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(state, f, indent=4)
+        os.replace(tmp_path, self.state_file)
+
+    def _next_batch(self, state: dict) -> list:
+        """Lists up to batch_size (backend, key) pairs and advances the position in state."""
+        sources = self.get_sources()
+        if state['source'] >= len(sources):
+            state['source'], state['cursor'] = 0, None
+        batch = []
+        while len(batch) < self.batch_size:
+            backend = sources[state['source']]
+            entries, cursor = backend.list_paginated('', state['cursor'], self.batch_size - len(batch))
+            batch.extend((backend, entry['pathname']) for entry in entries
+                         if not entry['pathname'].endswith('/'))
+            if cursor and entries:
+                state['cursor'] = cursor
+                continue
+            state['source'], state['cursor'] = state['source'] + 1, None
+            if state['source'] == len(sources):
+                # Every file has been checked once; start over on the next run
+                state['source'] = 0
+                state['last_full_pass'] = datetime.now().isoformat()
+                break
+        return batch
+
+    def _throttle(self, size):
+        if self.bucket is None:
+            return
+        while True:
+            wait = self.bucket.consume(size)
+            if not wait:
+                return
+            time.sleep(wait)
+
+    def hash_copy(self, backend, key) -> Optional[str]:
+        """Returns the SHA-256 of one stored copy, or None if the copy doesn't exist."""
+        sha = hashlib.sha256()
+        path = backend.local_path(key)
+        if path:
+            with open(path, 'rb') as f:
+                while True:
+                    chunk = f.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    # Charge what was actually read, so small files don't cost a whole chunk
+                    self._throttle(len(chunk))
+                    sha.update(chunk)
+            return sha.hexdigest()
+
+        entry = backend.stat(key)
+        if entry is None:
+            return None
+        for start in range(0, entry['size'], CHUNK_SIZE):
+            end = min(start + CHUNK_SIZE, entry['size'])
+            self._throttle(end - start)
+            chunk = backend.get_range(key, start, end)
+            if chunk is None:
+                return None
+            sha.update(chunk)
+        return sha.hexdigest()
+
+    def verify(self, key: str, expected: str) -> dict:
+        """Hashes every copy of key and returns the fields to store for it."""
+        copies = []
+        for label, backend in self.get_copies():
+            try:
+                # Each copy is checked against its own sidecar, so a copy that is
+                # still waiting for a write-back isn't mistaken for corruption
+                meta = backend.get_meta(key)
+                actual = self.hash_copy(backend, key)
+            except Exception as e:
+                logging.error(f"Scrubber failed to read {label} copy of {key}: {e}")
+                continue
+            if actual is not None:
+                copy_expected = meta['sha256'] if meta else expected
+                copies.append({'copy': label, 'sha256': actual, 'ok': actual == copy_expected})
+
+        if not copies:
+            status = 'missing'
+        elif all(copy['ok'] for copy in copies):
+            status = 'ok'
+        else:
+            status = 'mismatch'
+            bad = ', '.join(copy['copy'] for copy in copies if not copy['ok'])
+            logging.error(f"Checksum mismatch for {key} ({bad} copy)")
+        return {
+            'status': status,
+            'verified_at': datetime.now().isoformat(),
+            'copies': copies,
+        }
+
+    @staticmethod
+    def _current_sha256(backend, key: str) -> Optional[str]:
+        meta = backend.get_meta(key)
+        return meta['sha256'] if meta else None
+
+    def check(self, backend, key: str) -> dict:
+        """Verifies one file listed by backend against the checksum stored with it."""
+        meta = backend.get_meta(key)
+        if meta is None:
+            # Stored before checksums were recorded, or the metadata is gone
+            return {'status': 'unverified', 'verified_at': datetime.now().isoformat(), 'copies': []}
+        result = self.verify(key, meta['sha256'])
+        result['expected_sha256'] = meta['sha256']
+        return result
+
+    def run(self) -> dict:
+        """Verifies the next batch of files and returns a summary of the run."""
+        if not self._run_lock.acquire(blocking=False):
+            return {'skipped': 'A scrub is already running'}
+        try:
+            started = time.monotonic()
+            state = self._load_state()
+            batch = self._next_batch(state)
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                results = list(pool.map(lambda item: self.check(*item), batch))
+
+            problems = state['problems']
+            statuses = []
+            for (backend, key), result in zip(batch, results):
+                # A re-upload or delete while hashing makes the result stale
+                if self._current_sha256(backend, key) != result.get('expected_sha256'):
+                    problems.pop(key, None)
+                    statuses.append('changed')
+                    continue
+                statuses.append(result['status'])
+                if result['status'] in ('mismatch', 'missing'):
+                    problems[key] = result
+                else:
+                    problems.pop(key, None)
+
+            state['last_run'] = {
+                'finished_at': datetime.now().isoformat(),
+                'duration_seconds': round(time.monotonic() - started, 3),
+                'files_checked': len(batch),
+                'ok': statuses.count('ok'),
+                'mismatch': statuses.count('mismatch'),
+                'missing': statuses.count('missing'),
+                'unverified': statuses.count('unverified'),
+                'changed': statuses.count('changed'),
+            }
+            self._save_state(state)
+            logging.info(f"Integrity scrub checked {len(batch)} files: "
+                         f"{statuses.count('mismatch')} mismatched, {statuses.count('missing')} missing")
+            return state['last_run']
+        finally:
+            self._run_lock.release()
+
+    def report(self) -> dict:
+        """Mismatched or missing files and the last run summary, for the admin endpoint."""
+        state = self._load_state()
+        sources = self.get_sources()
+        problems: List[dict] = []
+        for key, result in sorted(state['problems'].items()):
+            # Skip files replaced or deleted since they were checked
+            current = None
+            for backend in sources:
+                current = self._current_sha256(backend, key)
+                if current:
+                    break
+            if current == result.get('expected_sha256'):
+                problems.append(dict(result, path=key))
+        return {
+            'problems': problems,
+            'last_scrub': state['last_run'],
+            'last_full_pass': state['last_full_pass'],
+        }
@@ -0,0 +1,228 @@
+"""
+Per-client admission control for client-facing endpoints.
+
+A token bucket per client limits the request rate and another paces how
+fast the upload body is read, and a fair scheduler shares a fixed number of
+upload slots round-robin between clients, so one client re-uploading a whole
+folder cannot starve the others. All of this happens before the body is
+read, so throttled clients don't have their uploads buffered first.
+
+State is kept in memory, so limits apply per server process.
+"""
+import threading
+import time
+from collections import deque, OrderedDict
+from typing import Optional
+
+
+class TokenBucket:
+    """
+    Token bucket refilled at `rate` tokens per second up to `capacity`.
+
+    A request may take more tokens than are available as long as the bucket
+    is not in debt, so single uploads larger than the burst size still pass;
+    the debt is then paid back before the next request is admitted.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def configure(self, rate: float, capacity: float):
+        """Updates the limits, keeping the current fill level."""
+        with self._lock:
+            self._refill()
+            self.rate = rate
+            self.capacity = capacity
+            self.tokens = min(self.tokens, capacity)
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def consume(self, amount: float = 1) -> float:
+        """
+        Takes `amount` tokens if the bucket is not in debt.
+
+        Returns:
+            0 if admitted, otherwise the number of seconds to wait before retrying
+        """
+        with self._lock:
+            self._refill()
+            # Requests up to the burst size need the full amount; larger ones only a non-negative bucket
+            needed = min(amount, self.capacity) if self.capacity > 0 else 0
+            if self.tokens >= needed:
+                self.tokens -= amount
+                return 0
+            return (needed - self.tokens) / self.rate
+
+    def reserve(self, amount: float) -> float:
+        """Takes `amount` tokens unconditionally and returns the seconds until the bucket is out of debt."""
+        with self._lock:
+            self._refill()
+            self.tokens -= amount
+            return max(0.0, -self.tokens / self.rate)
+
+
+class PacedReader:
+    """Wraps a binary stream so reads take no more than the bucket allows."""
+
+    def __init__(self, stream, bucket: TokenBucket):
+        self.stream = stream
+        self.bucket = bucket
+
+    def read(self, size=-1):
+        data = self.stream.read(size)
+        wait = self.bucket.reserve(len(data))
+        if wait:
+            time.sleep(wait)
+        return data
+
+
+class FairScheduler:
+    """
+    Limits concurrent work to `slots` (and `max_active_per_client` per
+    client) and grants free slots round-robin across clients, FIFO within
+    a client.
+    """
+
+    def __init__(self, slots: int, max_active_per_client: int, max_queued_per_client: int):
+        self.slots = slots
+        self.max_active_per_client = max_active_per_client
+        self.max_queued_per_client = max_queued_per_client
+        self._active = 0
+        self._active_by_client = {}
+        self._queues = OrderedDict()  # client_id -> deque of waiting tickets
+        self._cond = threading.Condition()
+
+    def _grant_next(self):
+        """Hands free slots to the heads of the client queues in round-robin order."""
+        while self._active < self.slots:
+            # First client in the rotation that is below its own limit
+            for client_id, waiting in self._queues.items():
+                if self._active_by_client.get(client_id, 0) < self.max_active_per_client:
+                    break
+            else:
+                break
+            ticket = waiting.popleft()
+            # Move the client to the back of the rotation
+            del self._queues[client_id]
+            if waiting:
+                self._queues[client_id] = waiting
+            ticket['granted'] = True
+            self._active += 1
+            self._active_by_client[client_id] = self._active_by_client.get(client_id, 0) + 1
+        self._cond.notify_all()
+
+    def acquire(self, client_id: str, timeout: float) -> bool:
+        """Waits up to `timeout` seconds for a slot. Returns False if none was granted."""
+        with self._cond:
+            waiting = self._queues.get(client_id)
+            if waiting is not None and len(waiting) >= self.max_queued_per_client:
+                return False
+            ticket = {'granted': False}
+            self._queues.setdefault(client_id, deque()).append(ticket)
+            self._grant_next()
+            deadline = time.monotonic() + timeout
+            while not ticket['granted']:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    waiting = self._queues.get(client_id)
+                    if waiting is not None:
+                        waiting.remove(ticket)
+                        if not waiting:
+                            del self._queues[client_id]
+                    return False
+                self._cond.wait(remaining)
+            return True
+
+    def release(self, client_id: str):
+        with self._cond:
+            self._active -= 1
+            self._active_by_client[client_id] -= 1
+            if not self._active_by_client[client_id]:
+                del self._active_by_client[client_id]
+            self._grant_next()
+
+    def queued(self) -> dict:
+        """Number of waiting requests per client."""
+        with self._cond:
+            return {client_id: len(waiting) for client_id, waiting in self._queues.items()}
+
+
+class Throttled(Exception):
+    """Raised when a client must back off; retry_after is in seconds."""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class ClientRateLimiter:
+    """
+    Per-client request-rate and bandwidth buckets plus the shared upload scheduler.
+
+    Client IDs come from unauthenticated requests, so at most `max_clients`
+    buckets of each kind are kept; the least recently used are dropped.
+    """
+
+    def __init__(self, upload_slots: int, max_active_per_client: int, max_queued_per_client: int,
+                 queue_timeout: float, max_clients: int = 10000):
+        self.scheduler = FairScheduler(upload_slots, max_active_per_client, max_queued_per_client)
+        self.queue_timeout = queue_timeout
+        self.max_clients = max_clients
+        self._request_buckets = OrderedDict()
+        self._bandwidth_buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _bucket(self, buckets, client_id, rate, capacity):
+        with self._lock:
+            bucket = buckets.get(client_id)
+            if bucket is None:
+                bucket = buckets[client_id] = TokenBucket(rate, capacity)
+                while len(buckets) > self.max_clients:
+                    buckets.popitem(last=False)
+                return bucket
+            buckets.move_to_end(client_id)
+        if bucket.rate != rate or bucket.capacity != capacity:
+            bucket.configure(rate, capacity)
+        return bucket
+
+    def check_request(self, client_id: str, per_minute: Optional[float]):
+        """Counts one request against the client's rate limit (None or 0 means unlimited)."""
+        if not per_minute:
+            return
+        bucket = self._bucket(self._request_buckets, client_id, per_minute / 60.0, per_minute)
+        wait = bucket.consume(1)
+        if wait:
+            raise Throttled(f"Request rate limit of {per_minute:g}/min exceeded", wait)
+
+    def pace_stream(self, client_id: str, stream, kbps: Optional[float]):
+        """Wraps an input stream so it is read at most at the client's bandwidth limit (None or 0 means unlimited)."""
+        if not kbps:
+            return stream
+        rate = kbps * 1024
+        # Allow a burst of a few seconds' worth of bandwidth
+        return PacedReader(stream, self._bucket(self._bandwidth_buckets, client_id, rate, rate * 5))
+
+    def upload_slot(self, client_id: str):
+        """Context manager holding a fair-queued upload slot; raises Throttled if none frees up."""
+        return _UploadSlot(self, client_id)
+
+
+class _UploadSlot:
+    def __init__(self, limiter, client_id):
+        self.limiter = limiter
+        self.client_id = client_id
+
+    def __enter__(self):
+        if not self.limiter.scheduler.acquire(self.client_id, self.limiter.queue_timeout):
+            raise Throttled("Server busy, upload queue is full", self.limiter.queue_timeout)
+        return self
+
+    def __exit__(self, *exc):
+        self.limiter.scheduler.release(self.client_id)
@@ -444,6 +444,15 @@ document.addEventListener("DOMContentLoaded", () => {
                         <label for="mgmt-retention-input-${clientId}">Retention (days)</label>
                         <input type="number" id="mgmt-retention-input-${clientId}" value="${client.retention_days || 30}" min="1">
                     </div>
+                    <div class="form-group">
+                        <label for="mgmt-rate-input-${clientId}">Rate Limit (requests/min)</label>
+                        <input type="number" id="mgmt-rate-input-${clientId}" value="${client.rate_limit_per_minute ?? ''}" min="0" placeholder="Server default">
+                    </div>
+                    <div class="form-group">
+                        <label for="mgmt-bandwidth-input-${clientId}">Bandwidth Limit (KB/s)</label>
+                        <input type="number" id="mgmt-bandwidth-input-${clientId}" value="${client.bandwidth_limit_kbps ?? ''}" min="0" placeholder="Server default">
+                        <p class="help-text">0 disables the limit, empty uses the server default.</p>
+                    </div>
                     <button type="submit" class="action-btn save-btn">Update Client</button>
                 </form>
             `;
@@ -459,11 +468,18 @@ document.addEventListener("DOMContentLoaded", () => {
             const clientId = event.target.dataset.id;
             const newLabel = document.getElementById(`mgmt-label-input-${clientId}`).value;
             const newRetention = document.getElementById(`mgmt-retention-input-${clientId}`).value;
+            const newRateLimit = document.getElementById(`mgmt-rate-input-${clientId}`).value;
+            const newBandwidthLimit = document.getElementById(`mgmt-bandwidth-input-${clientId}`).value;
 
             fetch(`/admin/clients/${clientId}/settings`, {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({ label: newLabel, retention_days: newRetention })
+                body: JSON.stringify({
+                    label: newLabel,
+                    retention_days: newRetention,
+                    rate_limit_per_minute: newRateLimit,
+                    bandwidth_limit_kbps: newBandwidthLimit
+                })
             })
             .then(res => {
                 if(res.ok) fetchAndRender(); // Refresh dashboard on success
@@ -0,0 +1,626 @@
+"""
+Pluggable storage backends for uploaded files.
+
+Every route in app.py goes through a StorageBackend instead of branching on
+the storage mode. Keys are relative to the uploads root and always use '/'
+separators, e.g. 'client_id/2025-01-15/file.pdf'. A key ending in '/' is a
+folder marker (an empty folder created through /create-dir), following the
+Vercel Blob convention for folders.
+
+Every backend hashes files as they are stored and keeps the checksum next
+to the object (a sidecar file or blob), so it can't drift from the data.
+
+Backends:
+    LocalStorage  - files on the local filesystem (default)
+    BlobStorage   - Vercel Blob Storage via blob_storage.py
+    TieredStorage - local write-back cache in front of another backend
+"""
+import itertools
+import json
+import os
+import queue
+import shutil
+import tempfile
+import threading
+import logging
+from datetime import datetime, timezone
+from typing import Optional, BinaryIO, Iterable, Iterator, List, Tuple
+
+from werkzeug.security import safe_join
+
+from integrity import HashingReader, VerificationFailed
+
+# Suffix of in-flight writes; never listed.
+PARTIAL_SUFFIX = '.part'
+
+# Backoff between failed write-back attempts, in seconds
+WRITE_BACK_RETRY_MIN = 5
+WRITE_BACK_RETRY_MAX = 15 * 60
+
+
+def normalize_key(key: str) -> str:
+    """Normalizes a storage key to '/' separators without a leading slash."""
+    return key.replace("\\", "/").lstrip("/")
+
+
+class StorageBackend:
+    """Interface shared by all storage backends."""
+
+    name = 'base'
+    # Whether uploads count against MAX_STORAGE_BYTES before being accepted.
+    quota_enforced = False
+
+    def put_stream(self, key: str, stream: BinaryIO, expected_size: Optional[int] = None,
+                   expected_sha256: Optional[str] = None) -> Optional[dict]:
+        """
+        Stores the contents of a readable binary stream under key.
+
+        If expected_size or expected_sha256 is given, the contents are
+        checked before they replace an existing object under key.
+
+        Returns:
+            Dict with at least 'pathname' and 'size' (plus 'sha256' for
+            files), or None on error
+
+        Raises:
+            VerificationFailed: the contents don't match; nothing was stored
+        """
+        raise NotImplementedError
+
+    def get_meta(self, key: str) -> Optional[dict]:
+        """
+        Returns the checksum metadata recorded when key was stored.
+
+        Returns:
+            Dict with 'sha256', 'size' and 'stored_at', or None if unknown
+        """
+        raise NotImplementedError
+
+    def get_range(self, key: str, start: int = 0, end: Optional[int] = None) -> Optional[bytes]:
+        """Reads bytes [start, end) of key (to the end if end is None), or None if missing."""
+        raise NotImplementedError
+
+    def delete_batch(self, keys: Iterable[str]) -> List[str]:
+        """
+        Deletes the given keys and returns the ones that were removed.
+
+        A folder key (ending in '/') only removes the folder marker; folders
+        that still contain files are left alone.
+        """
+        raise NotImplementedError
+
+    def list_paginated(self, prefix: str = '', cursor: Optional[str] = None,
+                       limit: int = 1000) -> Tuple[List[dict], Optional[str]]:
+        """
+        Lists one page of entries whose key starts with prefix.
+
+        Returns:
+            (entries, next_cursor); each entry has 'pathname', 'size' and
+            'uploadedAt'. next_cursor is None on the last page.
+        """
+        raise NotImplementedError
+
+    def stat(self, key: str) -> Optional[dict]:
+        """Returns the entry for key (same shape as list entries), or None if missing."""
+        raise NotImplementedError
+
+    def make_dir(self, key: str) -> None:
+        """Creates an empty folder marker for key."""
+        key = normalize_key(key).rstrip('/') + '/'
+        if self.stat(key) is None:
+            self.put_stream(key, _EmptyStream())
+
+    def local_path(self, key: str) -> Optional[str]:
+        """Returns a filesystem path for key if it can be served straight from disk."""
+        return None
+
+    def copies(self) -> List[Tuple[str, 'StorageBackend']]:
+        """The (label, backend) pairs that each hold their own copy of a file."""
+        return [(self.name, self)]
+
+    def iter_entries(self, prefix: str = '') -> Iterator[dict]:
+        """Iterates over every entry under prefix, following pagination."""
+        cursor = None
+        while True:
+            entries, cursor = self.list_paginated(prefix, cursor)
+            yield from entries
+            if not cursor:
+                return
+
+    def usage(self) -> int:
+        """Total size in bytes of everything stored."""
+        return sum(entry.get('size', 0) for entry in self.iter_entries())
+
+
+class _EmptyStream:
+    def read(self, size=-1):
+        return b''
+
+
+def _checksum_meta(reader: HashingReader) -> dict:
+    return {
+        'sha256': reader.hexdigest(),
+        'size': reader.size,
+        'stored_at': datetime.now(timezone.utc).isoformat(),
+    }
+
+
+class LocalStorage(StorageBackend):
+    """
+    Stores files in a directory on the local filesystem.
+
+    Checksums live in a parallel '<root>.meta' tree as one JSON file per
+    object. Each records the inode of the file it describes, and since
+    files are written to a temporary file and renamed into place, metadata
+    left behind by an older write (or a racing process) is never matched to
+    the new contents.
+    """
+
+    name = 'local'
+    quota_enforced = True
+
+    def __init__(self, root: str):
+        self.root = root
+        self.meta_root = root.rstrip('/\\') + '.meta'
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, key: str) -> Optional[str]:
+        key = normalize_key(key).rstrip('/')
+        if not key:
+            return None
+        return safe_join(self.root, key)
+
+    def _meta_path(self, key: str) -> Optional[str]:
+        key = normalize_key(key)
+        if not key or key.endswith('/'):
+            return None
+        return safe_join(self.meta_root, key + '.json')
+
+    def _write_meta(self, key, meta):
+        meta_path = self._meta_path(key)
+        os.makedirs(os.path.dirname(meta_path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(meta_path), prefix='.',
+                                        suffix=PARTIAL_SUFFIX)
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(meta, f)
+            os.replace(tmp_path, meta_path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def _entry(self, key: str, path: str) -> dict:
+        st = os.stat(path)
+        return {
+            'pathname': key,
+            'size': 0 if key.endswith('/') else st.st_size,
+            'uploadedAt': datetime.fromtimestamp(st.st_mtime, timezone.utc).isoformat(),
+        }
+
+    def put_stream(self, key, stream, expected_size=None, expected_sha256=None):
+        key = normalize_key(key)
+        path = self._path(key)
+        if path is None:
+            return None
+        if key.endswith('/'):
+            os.makedirs(path, exist_ok=True)
+            return self._entry(key, path)
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temporary file and rename so readers never see a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.',
+                                        suffix=PARTIAL_SUFFIX)
+        reader = HashingReader(stream)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                shutil.copyfileobj(reader, f, 1024 * 1024)
+            # Checked before the rename so a bad upload never replaces the current file
+            reader.verify(expected_size, expected_sha256)
+            meta = _checksum_meta(reader)
+            # The rename keeps the inode, which ties the metadata to this write
+            meta['inode'] = os.stat(tmp_path).st_ino
+            self._write_meta(key, meta)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logging.error(f"Failed to write {key} to local storage: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return None
+        except VerificationFailed:
+            os.remove(tmp_path)
+            raise
+        result = self._entry(key, path)
+        result['sha256'] = meta['sha256']
+        return result
+
+    def get_meta(self, key):
+        path = self._path(key)
+        meta_path = self._meta_path(key)
+        if path is None or meta_path is None:
+            return None
+        try:
+            with open(meta_path, 'r') as f:
+                meta = json.load(f)
+            if meta.pop('inode', None) != os.stat(path).st_ino:
+                return None  # Left over from an older version of the file
+        except (OSError, ValueError):
+            return None
+        return meta
+
+    def get_range(self, key, start=0, end=None):
+        path = self._path(key)
+        if path is None or not os.path.isfile(path):
+            return None
+        with open(path, 'rb') as f:
+            f.seek(start)
+            return f.read() if end is None else f.read(max(end - start, 0))
+
+    def delete_batch(self, keys):
+        deleted = []
+        for key in keys:
+            key = normalize_key(key)
+            path = self._path(key)
+            try:
+                if path is None:
+                    continue
+                if key.endswith('/'):
+                    if os.path.isdir(path) and not os.listdir(path):
+                        os.rmdir(path)
+                        deleted.append(key)
+                elif os.path.isfile(path):
+                    os.remove(path)
+                    deleted.append(key)
+                    meta_path = self._meta_path(key)
+                    if os.path.exists(meta_path):
+                        os.remove(meta_path)
+                        self._prune_empty_dirs(os.path.dirname(meta_path), self.meta_root)
+                else:
+                    continue
+                self._prune_empty_dirs(os.path.dirname(path))
+            except OSError as e:
+                logging.error(f"Error deleting local file {key}: {e}")
+        return deleted
+
+    def _prune_empty_dirs(self, dir_path, root=None):
+        """Removes empty parent directories up to (not including) the root."""
+        root = os.path.abspath(root or self.root)
+        dir_path = os.path.abspath(dir_path)
+        while dir_path != root and dir_path.startswith(root) and os.path.isdir(dir_path) \
+                and not os.listdir(dir_path):
+            os.rmdir(dir_path)
+            dir_path = os.path.dirname(dir_path)
+
+    def _iter_keys(self, prefix):
+        """Yields (key, path) pairs in sorted key order."""
+        # Only walk the deepest directory that can contain the prefix
+        base = normalize_key(prefix).rsplit('/', 1)[0] if '/' in prefix else ''
+        start = self._path(base) if base else self.root
+        if start is None or not os.path.isdir(start):
+            return
+        entries = []
+        for root, dirs, files in os.walk(start):
+            rel_root = os.path.relpath(root, self.root).replace(os.sep, '/')
+            rel_root = '' if rel_root == '.' else rel_root + '/'
+            if rel_root and not dirs and not files:
+                entries.append((rel_root, root))
+            for name in files:
+                if name.endswith(PARTIAL_SUFFIX):
+                    continue
+                entries.append((rel_root + name, os.path.join(root, name)))
+        entries.sort()
+        for key, path in entries:
+            if key.startswith(prefix):
+                yield key, path
+
+    def list_paginated(self, prefix='', cursor=None, limit=1000):
+        prefix = normalize_key(prefix)
+        entries = []
+        for key, path in self._iter_keys(prefix):
+            if cursor is not None and key <= cursor:
+                continue
+            if len(entries) == limit:
+                return entries, entries[-1]['pathname']
+            try:
+                entries.append(self._entry(key, path))
+            except OSError:
+                pass  # File might have been deleted
+        return entries, None
+
+    def iter_entries(self, prefix=''):
+        # Walk the tree once instead of once per page
+        for key, path in self._iter_keys(normalize_key(prefix)):
+            try:
+                yield self._entry(key, path)
+            except OSError:
+                pass  # File might have been deleted
+
+    def stat(self, key):
+        key = normalize_key(key)
+        path = self._path(key)
+        if path is None or not os.path.exists(path):
+            return None
+        if key.endswith('/') != os.path.isdir(path):
+            return None
+        return self._entry(key, path)
+
+    def local_path(self, key):
+        path = self._path(key)
+        if path is None or not os.path.isfile(path):
+            return None
+        return path
+
+
+class BlobStorage(StorageBackend):
+    """Stores files in Vercel Blob Storage under a path prefix."""
+
+    name = 'blob'
+
+    def __init__(self, prefix: str = 'uploads/'):
+        self.prefix = prefix
+        # Imported here so the requests dependency is only needed in blob mode
+        import blob_storage
+        self._api = blob_storage
+
+    def _blob_path(self, key):
+        return self.prefix + normalize_key(key)
+
+    def _meta_path(self, key):
+        # Kept outside the prefix so sidecars never show up in listings
+        return f".meta/{self._blob_path(key)}.json"
+
+    def _entry(self, blob):
+        return {
+            'pathname': blob.get('pathname', '')[len(self.prefix):],
+            'size': blob.get('size', 0),
+            'uploadedAt': blob.get('uploadedAt'),
+            'url': blob.get('url'),
+        }
+
+    def put_stream(self, key, stream, expected_size=None, expected_sha256=None):
+        key = normalize_key(key)
+        if key.endswith('/'):
+            reader = None
+        else:
+            if expected_size is not None or expected_sha256:
+                # A blob is live as soon as it is uploaded, so check the (seekable) stream first
+                start = stream.tell()
+                check = HashingReader(stream)
+                while check.read(1024 * 1024):
+                    pass
+                check.verify(expected_size, expected_sha256)
+                stream.seek(start)
+            stream = reader = HashingReader(stream)
+        result = self._api.put_blob(self._blob_path(key), stream, access='public')
+        if result is None:
+            return None
+        result = dict(result)
+        result['pathname'] = key
+        if reader is not None:
+            meta = _checksum_meta(reader)
+            if self._api.put_blob(self._meta_path(key), json.dumps(meta).encode('utf-8'),
+                                  access='public') is None:
+                logging.warning(f"Could not store the checksum of {key}")
+            result.setdefault('size', meta['size'])
+            result['sha256'] = meta['sha256']
+        return result
+
+    def get_meta(self, key):
+        if normalize_key(key).endswith('/'):
+            return None
+        data = self._api.get_blob(self._meta_path(key))
+        if data is None:
+            return None
+        try:
+            return json.loads(data)
+        except ValueError:
+            return None
+
+    def get_range(self, key, start=0, end=None):
+        byte_range = None if (start == 0 and end is None) else (start, end)
+        return self._api.get_blob(self._blob_path(key), byte_range)
+
+    def delete_batch(self, keys):
+        keys = [normalize_key(key) for key in keys]
+        paths = [self._blob_path(key) for key in keys]
+        paths += [self._meta_path(key) for key in keys if not key.endswith('/')]
+        if self._api.delete_blobs(paths):
+            return keys
+        return []
+
+    def list_paginated(self, prefix='', cursor=None, limit=1000):
+        page = self._api.list_blobs_page(self._blob_path(prefix), cursor, limit)
+        if page is None:
+            return [], None
+        entries = [self._entry(blob) for blob in page.get('blobs', [])
+                   if blob.get('pathname', '').startswith(self.prefix)]
+        return entries, page.get('cursor') if page.get('hasMore') else None
+
+    def stat(self, key):
+        blob = self._api.head_blob(self._blob_path(key))
+        return self._entry(blob) if blob else None
+
+
+class TieredStorage(StorageBackend):
+    """
+    Local write-back cache in front of a slower backend (usually BlobStorage).
+
+    Uploads complete as soon as they are on local disk; a background thread
+    then copies them to the backing store, retrying failures with backoff.
+    On startup the thread first compares the cache with the backing store
+    and queues anything that never made it across. Reads are served from the
+    cache when possible. Use flush() to wait for pending write-backs.
+    """
+
+    name = 'tiered'
+
+    def __init__(self, cache: LocalStorage, backing: StorageBackend):
+        self.cache = cache
+        self.backing = backing
+        # key -> version of the latest local write that still has to be copied
+        self._pending = {}
+        self._versions = itertools.count(1)
+        self._lock = threading.Lock()
+        # Held while talking to the backing store, so a delete can't race an in-flight copy
+        self._transfer_lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._recovered = threading.Event()
+        self._worker = threading.Thread(target=self._write_back_loop, daemon=True,
+                                        name='storage-write-back')
+        self._worker.start()
+
+    def _mark_pending(self, key, only_if_new=False):
+        with self._lock:
+            if only_if_new and key in self._pending:
+                return
+            version = self._pending[key] = next(self._versions)
+        self._queue.put((key, version, 0))
+
+    def _recover_pending(self):
+        """Queues cached files that are missing from, or newer than, the backing store."""
+        try:
+            remote = {entry['pathname']: entry for entry in self.backing.iter_entries()}
+            for entry in self.cache.iter_entries():
+                key = entry['pathname']
+                if self._needs_write_back(entry, remote.get(key)):
+                    self._mark_pending(key, only_if_new=True)
+        except Exception as e:
+            logging.error(f"Could not compare the local cache with {self.backing.name} storage: {e}")
+        if self._pending:
+            logging.info(f"Queued {len(self._pending)} cached files for write-back")
+
+    @staticmethod
+    def _needs_write_back(local, remote):
+        if remote is None:
+            return True
+        if local['pathname'].endswith('/'):
+            return False
+        if remote.get('size') is not None and remote['size'] != local['size']:
+            return True
+        try:
+            return datetime.fromisoformat(local['uploadedAt']) > datetime.fromisoformat(remote['uploadedAt'])
+        except (KeyError, TypeError, ValueError):
+            return False
+
+    def _write_back_loop(self):
+        self._recover_pending()
+        self._recovered.set()
+        while True:
+            key, version, attempt = self._queue.get()
+            try:
+                if not self._write_back(key, version):
+                    self._retry_later(key, version, attempt)
+            except Exception as e:
+                logging.error(f"Write-back of {key} raised {type(e).__name__}: {e}")
+                self._retry_later(key, version, attempt)
+            finally:
+                self._queue.task_done()
+
+    def _retry_later(self, key, version, attempt):
+        delay = min(WRITE_BACK_RETRY_MIN * 2 ** attempt, WRITE_BACK_RETRY_MAX)
+        logging.warning(f"Write-back of {key} failed, retrying in {delay}s (attempt {attempt + 1})")
+        timer = threading.Timer(delay, self._queue.put, args=((key, version, attempt + 1),))
+        timer.daemon = True
+        timer.start()
+
+    def _write_back(self, key, version) -> bool:
+        """Copies one version of key to the backing store. Returns False if it should be retried."""
+        with self._transfer_lock:
+            with self._lock:
+                if self._pending.get(key) != version:
+                    return True  # Superseded by a newer write, or deleted
+            if key.endswith('/'):
+                result = self.backing.put_stream(key, _EmptyStream())
+            else:
+                path = self.cache.local_path(key)
+                if path is None:
+                    result = None
+                else:
+                    with open(path, 'rb') as f:
+                        result = self.backing.put_stream(key, f)
+            with self._lock:
+                if self._pending.get(key) != version:
+                    return True  # A newer write is queued and will be copied too
+                if result is None:
+                    return False
+                del self._pending[key]
+                return True
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Waits until all queued write-backs have been attempted (retries wait for their backoff)."""
+        done = threading.Event()
+
+        def wait():
+            self._recovered.wait()
+            self._queue.join()
+            done.set()
+
+        threading.Thread(target=wait, daemon=True).start()
+        return done.wait(timeout)
+
+    def pending(self) -> List[str]:
+        """Keys whose latest version is only on local disk so far."""
+        with self._lock:
+            return sorted(self._pending)
+
+    def put_stream(self, key, stream, expected_size=None, expected_sha256=None):
+        key = normalize_key(key)
+        result = self.cache.put_stream(key, stream, expected_size, expected_sha256)
+        if result is None:
+            return None
+        self._mark_pending(key)
+        return result
+
+    def get_range(self, key, start=0, end=None):
+        data = self.cache.get_range(key, start, end)
+        if data is not None:
+            return data
+        return self.backing.get_range(key, start, end)
+
+    def delete_batch(self, keys):
+        keys = [normalize_key(key) for key in keys]
+        with self._lock:
+            for key in keys:
+                self._pending.pop(key, None)
+        deleted = set(self.cache.delete_batch(keys))
+        # Wait for any in-flight copy so it can't recreate the file after the delete
+        with self._transfer_lock:
+            deleted.update(self.backing.delete_batch(keys))
+        return [key for key in keys if key in deleted]
+
+    def list_paginated(self, prefix='', cursor=None, limit=1000):
+        entries, next_cursor = self.backing.list_paginated(prefix, cursor, limit)
+        # Files not yet written back are newer in (or only exist in) the cache, so
+        # their backing entries are dropped from every page and the cache entries
+        # are listed once, on the first page
+        prefix = normalize_key(prefix)
+        cached = {}
+        for key in self.pending():
+            if key.startswith(prefix):
+                entry = self.cache.stat(key)
+                if entry:
+                    cached[key] = entry
+        entries = [entry for entry in entries if entry['pathname'] not in cached]
+        if cursor is None:
+            entries.extend(cached.values())
+        return entries, next_cursor
+
+    def stat(self, key):
+        return self.cache.stat(key) or self.backing.stat(key)
+
+    def get_meta(self, key):
+        # The backing copy gets its own metadata when it is written back
+        if self.cache.local_path(key):
+            return self.cache.get_meta(key)
+        return self.backing.get_meta(key)
+
+    def make_dir(self, key):
+        key = normalize_key(key).rstrip('/') + '/'
+        if self.cache.stat(key) is None:
+            self.put_stream(key, _EmptyStream())
+
+    def local_path(self, key):
+        return self.cache.local_path(key)
+
+    def copies(self):
+        return [('cache', self.cache)] + self.backing.copies()